@@ -4,32 +4,102 @@ import datetime
 import uuid
 import time
 import threading
+import queue
+import atexit
+import functools
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
 import json
-from io import BytesIO
+import re
+import subprocess
+import csv
+import zlib
+import hashlib
+import base64
+import sqlite3
+from collections import OrderedDict
+from io import BytesIO, StringIO
+import copy
 
 # --- FLASK IMPORTS ---
-from flask import Flask, render_template, request, jsonify, Response, session, redirect, url_for, send_from_directory
+from flask import Flask, Request, render_template, request, jsonify, Response, session, redirect, url_for, send_from_directory, stream_with_context, has_request_context
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, tuple_
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 
 # --- SYSTEM & UTILS ---
 import psutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: no cross-worker lock, each process sweeps on its own
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: PDF workers run without a memory cap
 
 # --- AI & MEDIA IMPORTS ---
 from groq import Groq
+import httpx
 from gtts import gTTS
 from xhtml2pdf import pisa
+try:
+    from xhtml2pdf.context import pisaContext
+    from xhtml2pdf.default import DEFAULT_CSS
+    from xhtml2pdf.parser import DEFAULT_CSS_SOURCE
+except ImportError:
+    pisaContext = DEFAULT_CSS = DEFAULT_CSS_SOURCE = None  # internals moved: PDFs render without the stylesheet cache
 from pptx import Presentation
 import speech_recognition as sr
+import numpy as np
 import PIL.Image
 from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.config import FFMPEG_BINARY
+from proglog import ProgressBarLogger
 
 # --- SETUP ENV ---
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+# --- STREAMING UPLOADS ---
+# Werkzeug normally spools large uploads to an anonymous temp file, and routes then file.save() a second copy.
+# Here large uploads are written (and hashed) chunk by chunk straight into the upload folder,
+# so claim_upload() can move them into place with a rename instead of a copy.
+UPLOAD_SPOOL_THRESHOLD = 500 * 1024  # smaller bodies stay in memory, like Werkzeug's default
+
+class UploadStream:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w+b")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.claimed = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/close etc. go to the real file
+        return getattr(self.file, name)
+
+class StreamingUploadRequest(Request):
+    upload_folder = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_folder is None or (total_content_length or 0) < UPLOAD_SPOOL_THRESHOLD:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = UploadStream(os.path.join(self.upload_folder, f"upload_{uuid.uuid4().hex}.part"))
+        self.__dict__.setdefault('upload_streams', []).append(stream)
+        return stream
+
 app = Flask(__name__)
+app.request_class = StreamingUploadRequest
 app.secret_key = os.environ.get("SECRET_KEY", "super_secret_key_123")
 
 # --- VERCEL SPECIFIC CONFIGURATION ---
@@ -49,6 +119,7 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'users.db')
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+StreamingUploadRequest.upload_folder = STATIC_FOLDER
 
 # FIX: Allow uploads up to 100MB (Critical for Video to Audio)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024 
@@ -57,6 +128,77 @@ db = SQLAlchemy(app)
 
 # --- AI CONFIG ---
 API_KEY = os.environ.get("GROQ_API_KEY")
+LLM_MODEL = "llama-3.3-70b-versatile"
+# Keep-alive pool per worker. Size it to the gunicorn thread count so every thread can hold a warm connection.
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", os.environ.get("GUNICORN_THREADS", "4")))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+# Response cache for deterministic tools. LLM_CACHE_DB enables the on-disk tier (survives restarts).
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_DB = os.environ.get("LLM_CACHE_DB", "")
+LLM_CACHE_PURGE_INTERVAL = int(os.environ.get("LLM_CACHE_PURGE_INTERVAL", "300"))  # seconds between expired-row purges
+
+# --- ACTIVITY LOG CONFIG ---
+# Serverless instances may freeze background threads between requests, so Vercel logs synchronously.
+ACTIVITY_LOG_ASYNC = os.environ.get("ACTIVITY_LOG_ASYNC", "0" if IS_VERCEL else "1") == "1"
+ACTIVITY_LOG_QUEUE_SIZE = int(os.environ.get("ACTIVITY_LOG_QUEUE_SIZE", "10000"))
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get("ACTIVITY_LOG_BATCH_SIZE", "200"))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_LOG_FLUSH_INTERVAL", "1.0"))
+# 'drop' never delays a request when the queue is full; 'block' waits up to ACTIVITY_LOG_BLOCK_TIMEOUT seconds
+ACTIVITY_LOG_FULL_POLICY = os.environ.get("ACTIVITY_LOG_FULL_POLICY", "drop")
+ACTIVITY_LOG_BLOCK_TIMEOUT = float(os.environ.get("ACTIVITY_LOG_BLOCK_TIMEOUT", "2.0"))
+
+# --- MEDIA CONFIG ---
+# Pull the audio track out with ffmpeg (copying it untouched when possible) before falling back to MoviePy
+VIDEO_AUDIO_FAST_PATH = os.environ.get("VIDEO_AUDIO_FAST_PATH", "1") == "1"
+
+# --- PDF RENDERING CONFIG ---
+# pisa.CreatePDF is pure Python and holds the GIL, so renders run in a warm process pool
+PDF_POOL_ENABLED = os.environ.get("PDF_POOL_ENABLED", "0" if IS_VERCEL else "1") == "1"
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 2)))
+PDF_TIMEOUT = float(os.environ.get("PDF_TIMEOUT", "60"))  # per render, measured inside the worker
+PDF_QUEUE_TIMEOUT = float(os.environ.get("PDF_QUEUE_TIMEOUT", "120"))  # extra time a request waits for a free worker
+PDF_MEMORY_LIMIT_MB = int(os.environ.get("PDF_MEMORY_LIMIT_MB", "512"))  # extra address space per worker
+
+# --- PRESENTATION TEMPLATE CONFIG ---
+PPTX_TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get("PPTX_TEMPLATE_CACHE_MB", "64")) * 1024 * 1024  # parsed, per process
+PPTX_TEMPLATE_STORE_MAX_BYTES = int(os.environ.get("PPTX_TEMPLATE_STORE_MB", "256")) * 1024 * 1024  # on disk, shared
+
+# --- TEXT TO SPEECH CONFIG ---
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "gtts")
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "4"))
+TTS_SEGMENT_CHARS = int(os.environ.get("TTS_SEGMENT_CHARS", "400"))  # sentences are packed up to this size
+# gTTS builds "https://translate.google.{tld}/...", so only known Google Translate domains may be passed through
+TTS_ACCENT_TLDS = {"com", "com.au", "co.uk", "us", "ca", "co.in", "ie", "co.za", "com.br", "pt", "es", "com.mx", "fr", "cn"}
+
+# --- TRANSCRIPTION CONFIG ---
+# Long recordings are cut at the quietest point between MIN and MAX seconds and recognized in parallel
+TRANSCRIBE_BACKEND = os.environ.get("TRANSCRIBE_BACKEND", "google")
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "4"))
+TRANSCRIBE_CHUNK_MIN_SECONDS = float(os.environ.get("TRANSCRIBE_CHUNK_MIN_SECONDS", "20"))
+TRANSCRIBE_CHUNK_MAX_SECONDS = float(os.environ.get("TRANSCRIBE_CHUNK_MAX_SECONDS", "50"))
+
+# --- TEMP FILE CLEANUP CONFIG ---
+CLEANUP_FILE_TTL = int(os.environ.get("CLEANUP_FILE_TTL", "1800"))  # seconds a generated file is kept
+CLEANUP_INTERVAL = int(os.environ.get("CLEANUP_INTERVAL", "300"))   # seconds between sweeps
+# Full directory scans only catch files that never made it into the artifact registry (e.g. a crash mid-upload)
+CLEANUP_ORPHAN_SCAN_INTERVAL = int(os.environ.get("CLEANUP_ORPHAN_SCAN_INTERVAL", "3600"))
+ARTIFACT_USER_QUOTA_BYTES = int(os.environ.get("ARTIFACT_USER_QUOTA_MB", "200")) * 1024 * 1024
+ARTIFACT_MAX_TOTAL_BYTES = int(os.environ.get("ARTIFACT_MAX_TOTAL_MB", "2048")) * 1024 * 1024
+
+# --- BACKGROUND JOB CONFIG ---
+# async=1 on the heavy media routes queues a job instead of working in the request thread.
+# Disabled on Vercel, which cannot keep worker processes alive between requests.
+JOBS_ENABLED = os.environ.get("JOBS_ENABLED", "0" if IS_VERCEL else "1") == "1"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", str(os.cpu_count() or 2)))
+# Max jobs of each type running at once in this process, e.g. "video_to_audio=1,make_ppt=2"
+JOB_CONCURRENCY = os.environ.get("JOB_CONCURRENCY", "video_to_audio=1,audio_to_text=2,generate_quiz=2,make_ppt=2")
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "1800"))  # 'running' longer than this => worker died
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "2"))
 
 # --- ADMIN CONFIG ---
 ADMIN_USER = os.environ.get("ADMIN_USER", "admin")
@@ -80,15 +222,220 @@ class ActivityLog(db.Model):
     details = db.Column(db.String(200)) # e.g., 'Converted report.docx'
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    # Match the admin access patterns: per-user history/aggregates, recent activity, per-tool history
+    __table_args__ = (
+        db.Index('ix_activity_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_activity_type_timestamp', 'activity_type', 'timestamp'),
+    )
+
+class Artifact(db.Model):
+    # Every generated file in STATIC_FOLDER, indexed by expiry so cleanup never has to scan the directory
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(80), index=True)  # None for Admin/Guest
+    size = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class Job(db.Model):
+    # Durable queue for heavy media work; rows are claimed by whichever web process has a free slot
+    id = db.Column(db.String(32), primary_key=True)
+    job_type = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    username = db.Column(db.String(80))
+    payload = db.Column(db.Text, nullable=False)  # JSON kwargs for the task function
+    result = db.Column(db.Text)                   # JSON response fields once done
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Float, default=0)      # 0-100, written by the worker process
+    stage = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_type_created', 'status', 'job_type', 'created_at'),
+    )
+
+class PresentationTemplate(db.Model):
+    # Named templates registered by the admin; the .pptx itself lives in the template store under its SHA-256
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    layouts = db.Column(db.Text, nullable=False)                        # JSON layout index built at registration
+    content_layout = db.Column(db.Integer, nullable=False, default=0)   # layout used for title + bullet slides
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now)
+
+# --- LIGHTWEIGHT MIGRATION ---
+# create_all() skips tables that already exist, so older users.db files would never get new indexes.
+def ensure_indexes():
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Same story for columns added to an existing model (they must be nullable or have a default).
+def ensure_columns():
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing: continue
+                col_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'))
+
 # Create Database Tables
 # We do this inside a try/except block to ensure it works on Vercel startup
 with app.app_context():
     try:
         db.create_all()
+        ensure_columns()
+        ensure_indexes()
     except Exception as e:
         print(f"DB Init Error: {e}")
 
+def current_username():
+    # The admin account and guests are not rows in the user table
+    if not has_request_context(): return None
+    username = session.get('user_name')
+    return username if username != "Administrator" else None
+
+def claim_upload(file, dest_path):
+    """Moves an uploaded file to dest_path (a rename when it was streamed to disk). Returns its SHA-256."""
+    stream = file.stream
+    if isinstance(stream, UploadStream):
+        stream.file.close()
+        os.replace(stream.path, dest_path)
+        stream.claimed = True
+        return stream.sha256.hexdigest()
+    # Small in-memory upload: hash while writing it out
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    with open(dest_path, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(64 * 1024), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+@app.teardown_request
+def discard_unclaimed_uploads(exc=None):
+    for stream in request.__dict__.get('upload_streams', []):
+        if stream.claimed: continue
+        try:
+            stream.file.close()
+            os.remove(stream.path)
+        except OSError: pass
+
 # --- HELPER: LOGGING TO DB ---
+def write_activity_events(events):
+    # One username lookup and one transaction for the whole batch
+    usernames = {e["username"] for e in events if e["username"]}
+    user_ids = {}
+    if usernames:
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)).all())
+    db.session.add_all([
+        ActivityLog(
+            user_id=user_ids.get(e["username"]),
+            activity_type=e["activity_type"],
+            details=e["details"],
+            timestamp=e["timestamp"]
+        ) for e in events
+    ])
+    db.session.commit()
+
+class ActivityLogWriter:
+    """Background writer that flushes queued log events in multi-row transactions."""
+    _STOP = object()
+
+    def __init__(self, max_queue, batch_size, flush_interval, full_policy):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def submit(self, event):
+        self._ensure_started()
+        try:
+            if self.full_policy == "block":
+                self.queue.put(event, timeout=ACTIVITY_LOG_BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(event)
+        except queue.Full:
+            with self.lock: self.dropped += 1
+
+    def _ensure_started(self):
+        if self.thread is not None and self.pid == os.getpid(): return
+        with self.lock:
+            # A forked worker inherits a dead thread, so each process starts its own
+            if self.thread is None or self.pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.max_queue)
+                self.thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+                self.pid = os.getpid()
+                self.thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is self._STOP: break
+            batch = [first]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0: break
+                try: item = self.queue.get(timeout=remaining)
+                except queue.Empty: break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+        # Drain whatever is left on shutdown
+        leftovers = []
+        while True:
+            try: item = self.queue.get_nowait()
+            except queue.Empty: break
+            if item is not self._STOP: leftovers.append(item)
+        if leftovers: self._flush(leftovers)
+
+    def _flush(self, batch):
+        with app.app_context():
+            try:
+                write_activity_events(batch)
+                with self.lock:
+                    self.written += len(batch)
+                    self.batches += 1
+            except Exception as e:
+                db.session.rollback()
+                print(f"Logging Error: {e}")
+
+    def close(self, timeout=5):
+        if self.thread is None or self.pid != os.getpid(): return
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queued": self.queue.qsize() if self.queue else 0,
+                "written": self.written, "dropped": self.dropped, "batches": self.batches
+            }
+
+activity_writer = ActivityLogWriter(
+    ACTIVITY_LOG_QUEUE_SIZE, ACTIVITY_LOG_BATCH_SIZE, ACTIVITY_LOG_FLUSH_INTERVAL, ACTIVITY_LOG_FULL_POLICY
+)
+atexit.register(activity_writer.close)
+
 def log_activity(activity_type, details=""):
     try:
         # 1. Update Global Stats (In-Memory for Live Dashboard)
@@ -96,23 +443,17 @@ def log_activity(activity_type, details=""):
             global_stats[activity_type] += 1
             
         # 2. Log to Database (Permanent Record)
-        current_username = session.get('user_name')
-        user_id = None
-        
-        if current_username and current_username != "Administrator":
-            user = User.query.filter_by(username=current_username).first()
-            if user:
-                user_id = user.id
-        
-        # Create log entry
-        new_log = ActivityLog(
-            user_id=user_id,
-            activity_type=activity_type,
-            details=details,
-            timestamp=datetime.datetime.now()
-        )
-        db.session.add(new_log)
-        db.session.commit()
+        # Capture the session data now; the user id is resolved when the batch is written
+        event = {
+            "username": current_username(),
+            "activity_type": activity_type,
+            "details": details,
+            "timestamp": datetime.datetime.now()
+        }
+        if ACTIVITY_LOG_ASYNC:
+            activity_writer.submit(event)
+        else:
+            write_activity_events([event])
         
     except Exception as e:
         print(f"Logging Error: {e}")
@@ -125,49 +466,665 @@ global_stats = {
 }
 
 # --- CLEANUP TASK ---
-def cleanup_old_files():
+CLEANUP_STATE_FILE = os.path.join(STATIC_FOLDER, ".cleanup_state.json")
+SQLITE_SUFFIXES = ('.db', '.db-journal', '.db-wal', '.db-shm')
+
+def cleanup_old_files(ttl=CLEANUP_FILE_TTL):
+    """Deletes generated files older than ttl seconds. Returns (files_removed, bytes_removed)."""
+    files, reclaimed = 0, 0
     try:
         now = time.time()
         # Check if directory exists before listing
         if os.path.exists(STATIC_FOLDER):
-            for f in os.listdir(STATIC_FOLDER):
-                fpath = os.path.join(STATIC_FOLDER, f)
-                # Remove files older than 30 mins
-                if os.path.isfile(fpath) and now - os.path.getmtime(fpath) > 1800:
-                    try: os.remove(fpath)
+            for entry in os.scandir(STATIC_FOLDER):
+                # On Vercel the SQLite database lives in the same /tmp folder, so never touch it
+                if entry.name.startswith('.') or entry.name.endswith(SQLITE_SUFFIXES) or not entry.is_file(): continue
+                st = entry.stat()
+                if now - st.st_mtime > ttl:
+                    try:
+                        os.remove(entry.path)
+                        files += 1
+                        reclaimed += st.st_size
                     except: pass
     except: pass
+    return files, reclaimed
+
+# --- ARTIFACT REGISTRY ---
+def delete_artifacts(artifacts):
+    files, reclaimed = 0, 0
+    for artifact in artifacts:
+        try:
+            os.remove(os.path.join(STATIC_FOLDER, artifact.filename))
+            files += 1
+            reclaimed += artifact.size
+        except OSError: pass
+        db.session.delete(artifact)
+    db.session.commit()
+    return files, reclaimed
+
+def evict_oldest(query, excess):
+    # Oldest-expiring first until `excess` bytes are freed
+    victims = []
+    for artifact in query.order_by(Artifact.expires_at).yield_per(100):
+        if excess <= 0: break
+        victims.append(artifact)
+        excess -= artifact.size
+    return delete_artifacts(victims)
+
+def enforce_artifact_quotas(username, keep):
+    # `keep` is the file just handed to the client; it is never evicted, even if it alone exceeds a cap
+    candidates = Artifact.query.filter(Artifact.filename != keep)
+    if username:
+        used = db.session.query(func.sum(Artifact.size)).filter(Artifact.username == username).scalar() or 0
+        if used > ARTIFACT_USER_QUOTA_BYTES:
+            evict_oldest(candidates.filter(Artifact.username == username), used - ARTIFACT_USER_QUOTA_BYTES)
+    total = db.session.query(func.sum(Artifact.size)).scalar() or 0
+    if total > ARTIFACT_MAX_TOTAL_BYTES:
+        evict_oldest(candidates, total - ARTIFACT_MAX_TOTAL_BYTES)
+
+def register_artifact(fname, ttl=CLEANUP_FILE_TTL, username=None):
+    """Records a file just written to STATIC_FOLDER and enforces the per-user and total size caps."""
+    try:
+        username = username or current_username()
+        now = datetime.datetime.now()
+        db.session.add(Artifact(
+            filename=fname,
+            username=username,
+            size=os.path.getsize(os.path.join(STATIC_FOLDER, fname)),
+            created_at=now,
+            expires_at=now + datetime.timedelta(seconds=ttl)
+        ))
+        db.session.commit()
+        enforce_artifact_quotas(username, keep=fname)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Artifact Registry Error: {e}")
+
+def expire_artifacts(batch_size=500):
+    files, reclaimed = 0, 0
+    while True:
+        due = Artifact.query.filter(Artifact.expires_at <= datetime.datetime.now()) \
+            .order_by(Artifact.expires_at).limit(batch_size).all()
+        if not due: break
+        f, b = delete_artifacts(due)
+        files += f
+        reclaimed += b
+    return files, reclaimed
+
+def artifact_stats():
+    count, total = db.session.query(func.count(Artifact.id), func.sum(Artifact.size)).one()
+    return {"files": count, "bytes": total or 0}
+
+class FileSweeper:
+    """One periodic sweeper thread per process; a lock file makes sure only one worker sweeps per interval."""
+
+    def __init__(self, interval, state_path):
+        self.interval = interval
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def ensure_started(self):
+        if self.thread is not None and self.pid == os.getpid(): return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.thread = threading.Thread(target=self._run, name="file-sweeper", daemon=True)
+                self.pid = os.getpid()
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try: self.sweep_if_due()
+            except Exception as e: print(f"Cleanup Error: {e}")
+            time.sleep(self.interval)
+
+    def sweep_if_due(self):
+        with open(self.state_path, "a+") as fh:
+            if fcntl:
+                try: fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError: return False  # another worker is sweeping right now
+            state = self._read_state(fh)
+            now = time.time()
+            if now - state["last_sweep"] < self.interval:
+                return False
+            with app.app_context():
+                files, reclaimed = expire_artifacts()
+                purge_finished_jobs()
+            if now - state["last_orphan_scan"] >= CLEANUP_ORPHAN_SCAN_INTERVAL:
+                orphan_files, orphan_bytes = cleanup_old_files()
+                files += orphan_files
+                reclaimed += orphan_bytes
+                state["last_orphan_scan"] = now
+            state["last_sweep"] = now
+            state["files_removed"] += files
+            state["bytes_reclaimed"] += reclaimed
+            fh.seek(0)
+            fh.truncate()
+            json.dump(state, fh)
+            return True
+
+    @staticmethod
+    def _read_state(fh):
+        state = {"last_sweep": 0, "last_orphan_scan": 0, "files_removed": 0, "bytes_reclaimed": 0}
+        fh.seek(0)
+        try: state.update(json.loads(fh.read() or "{}"))
+        except ValueError: pass
+        return state
+
+    def stats(self):
+        try:
+            with open(self.state_path) as fh:
+                return self._read_state(fh)
+        except OSError:
+            return {"last_sweep": 0, "last_orphan_scan": 0, "files_removed": 0, "bytes_reclaimed": 0}
+
+file_sweeper = FileSweeper(CLEANUP_INTERVAL, CLEANUP_STATE_FILE)
 
 @app.before_request
 def before_request_cleanup():
-    # Only run cleanup on non-static requests to save resources
-    if request.endpoint != 'serve_static_files': 
-        threading.Thread(target=cleanup_old_files).start()
+    # Started lazily so each gunicorn worker (post-fork) owns its sweeper thread
+    file_sweeper.ensure_started()
+    # Same for the job dispatcher, so jobs queued before a restart are picked up without a new enqueue
+    if JOBS_ENABLED: job_dispatcher.ensure_started()
+    pdf_renderer.ensure_started()
+
+# --- BACKGROUND JOBS ---
+def parse_job_concurrency(spec):
+    limits = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            limits[name.strip()] = max(int(value), 1)
+    return limits
+
+class JobProgress:
+    """Writes percent/stage for a job to its row (throttled) so any web process can stream it."""
+
+    def __init__(self, job_id, min_interval=0.5):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.last_write = 0
+        self.last_stage = None
+
+    def update(self, percent, stage=None):
+        now = time.time()
+        stage = stage or self.last_stage
+        if stage == self.last_stage and now - self.last_write < self.min_interval: return
+        self.last_write, self.last_stage = now, stage
+        try:
+            with app.app_context():
+                Job.query.filter_by(id=self.job_id).update(
+                    {"progress": round(min(max(percent, 0), 100), 1), "stage": stage}, synchronize_session=False
+                )
+                db.session.commit()
+        except Exception as e:
+            print(f"Job Progress Error: {e}")
+
+class NullProgress:
+    # Inline (non-job) runs have nobody listening
+    def update(self, percent, stage=None): pass
+
+class MoviepyProgress(ProgressBarLogger):
+    """Forwards moviepy's progress bars to a JobProgress, scaled into [start, end] percent."""
+
+    def __init__(self, progress, stage, start=0, end=100):
+        super().__init__()
+        self.progress = progress
+        self.stage = stage
+        self.start, self.end = start, end
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != 'index': return
+        total = self.bars[bar].get('total') or 0
+        if total:
+            self.progress.update(self.start + (self.end - self.start) * value / total, self.stage)
+
+def run_job_task(job_type, payload, job_id):
+    # Executed inside the process pool
+    return JOB_TASKS[job_type](progress=JobProgress(job_id), **payload)
+
+class JobDispatcher:
+    """Claims queued Job rows and runs them on a warm process pool, respecting per-type concurrency."""
+
+    def __init__(self, max_workers, concurrency):
+        self.max_workers = max_workers
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = {}
+        self.pool = None
+        self.thread = None
+        self.pid = None
+
+    def ensure_started(self):
+        if self.thread is not None and self.pid == os.getpid(): return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pool = self._new_pool()
+                self.running = {job_type: 0 for job_type in JOB_TASKS}
+                self.thread = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+                self.pid = os.getpid()
+                self.thread.start()
+
+    def _new_pool(self):
+        # spawn, not fork: children must not inherit this process's threads and held locks
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _replace_pool(self, broken):
+        # A worker died (killed, OOM): the executor is unusable from now on, so swap in a fresh one
+        with self.lock:
+            if self.pool is not broken: return
+            self.pool = self._new_pool()
+        for proc in list((broken._processes or {}).values()):
+            proc.terminate()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, job_id, error):
+        # The job never got to run (or its worker was lost): retry it if attempts remain
+        job = db.session.get(Job, job_id)
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            update = {"status": "queued", "started_at": None}
+        else:
+            update = {"status": "failed", "error": error, "finished_at": datetime.datetime.now()}
+        Job.query.filter_by(id=job_id).update(update, synchronize_session=False)
+        db.session.commit()
+
+    def enqueue(self, job_type, payload, username=None):
+        self.ensure_started()
+        job = Job(id=uuid.uuid4().hex, job_type=job_type, username=username, payload=json.dumps(payload))
+        db.session.add(job)
+        db.session.commit()
+        self.wake.set()
+        return job.id
+
+    def _run(self):
+        while True:
+            self.wake.wait(JOB_POLL_INTERVAL)
+            self.wake.clear()
+            try:
+                with app.app_context():
+                    self._requeue_stale()
+                    self._claim_and_submit()
+            except Exception as e:
+                print(f"Job Dispatcher Error: {e}")
+
+    def _requeue_stale(self):
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=JOB_STALE_SECONDS)
+        stale = Job.query.filter(Job.status == 'running', Job.started_at < cutoff)
+        stale.filter(Job.attempts >= JOB_MAX_ATTEMPTS).update(
+            {"status": "failed", "error": "Worker stopped before the job finished", "finished_at": datetime.datetime.now()},
+            synchronize_session=False
+        )
+        stale.filter(Job.attempts < JOB_MAX_ATTEMPTS).update({"status": "queued"}, synchronize_session=False)
+        db.session.commit()
+
+    def _claim_and_submit(self):
+        for job_type in JOB_TASKS:
+            with self.lock:
+                free = self.concurrency.get(job_type, 1) - self.running[job_type]
+            if free <= 0: continue
+            queued = Job.query.filter_by(status='queued', job_type=job_type).order_by(Job.created_at).limit(free).all()
+            for job in queued:
+                # Conditional UPDATE so two web processes can never claim the same row
+                claimed = Job.query.filter_by(id=job.id, status='queued').update(
+                    {"status": "running", "started_at": datetime.datetime.now(), "attempts": Job.attempts + 1},
+                    synchronize_session=False
+                )
+                db.session.commit()
+                if not claimed: continue
+                with self.lock:
+                    self.running[job_type] += 1
+                    pool = self.pool
+                try:
+                    future = pool.submit(run_job_task, job_type, json.loads(job.payload), job.id)
+                except BrokenProcessPool:
+                    self._replace_pool(pool)
+                    # Undo the claim: this attempt never started
+                    Job.query.filter_by(id=job.id).update(
+                        {"status": "queued", "started_at": None, "attempts": Job.attempts - 1}, synchronize_session=False
+                    )
+                    db.session.commit()
+                    with self.lock:
+                        self.running[job_type] -= 1
+                    self.wake.set()
+                    continue
+                future.add_done_callback(functools.partial(self._finish, job.id, job_type, job.username, pool))
+
+    def _finish(self, job_id, job_type, username, pool, future):
+        try:
+            with app.app_context():
+                if future.cancelled() or isinstance(future.exception(), BrokenProcessPool):
+                    self._replace_pool(pool)
+                    self._release(job_id, "Job worker stopped unexpectedly")
+                    return
+                update = {"finished_at": datetime.datetime.now()}
+                try:
+                    result = future.result()
+                    if result.get("artifact"): register_artifact(result.pop("artifact"), username=username)
+                    update.update({"status": "done", "result": json.dumps(result), "progress": 100, "stage": "Done"})
+                except Exception as e:
+                    update.update({"status": "failed", "error": str(e)})
+                Job.query.filter_by(id=job_id).update(update, synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            print(f"Job Finish Error: {e}")
+        finally:
+            with self.lock:
+                self.running[job_type] -= 1
+            self.wake.set()
+
+    def stats(self):
+        counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+        with self.lock:
+            return {"by_status": counts, "running_here": dict(self.running)}
+
+job_dispatcher = JobDispatcher(JOB_WORKERS, parse_job_concurrency(JOB_CONCURRENCY))
+
+def purge_finished_jobs(ttl=CLEANUP_FILE_TTL):
+    # Results point at artifacts that expire after the same TTL, so the rows are useless by then
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=ttl)
+    purged = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return purged
+
+def run_media_task(job_type, payload):
+    """Runs a heavy task inline, or queues it as a job when the client sends async=1."""
+    if JOBS_ENABLED and request.values.get('async') == '1':
+        job_id = job_dispatcher.enqueue(job_type, payload, current_username())
+        return jsonify({"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+    try:
+        result = JOB_TASKS[job_type](**payload)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if result.get("artifact"): register_artifact(result.pop("artifact"))
+    return jsonify({"success": True, **result})
+
+def job_payload(job):
+    data = {
+        "success": job.status != 'failed', "job_id": job.id, "type": job.job_type, "status": job.status,
+        "percent": job.progress or 0, "stage": job.stage, "eta": None
+    }
+    # Linear estimate from elapsed time and percent done
+    if job.status == 'running' and job.started_at and job.progress:
+        elapsed = (datetime.datetime.now() - job.started_at).total_seconds()
+        data["eta"] = round(elapsed * (100 - job.progress) / job.progress, 1)
+    if job.status == 'done': data.update(json.loads(job.result))
+    if job.error: data["error"] = job.error
+    return data
+
+def get_visible_job(job_id):
+    job = db.session.get(Job, job_id)
+    # Only the owner (or an admin) can see a user's job
+    if not job or (job.username and job.username != current_username() and not session.get('is_admin')):
+        return None
+    return job
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_visible_job(job_id)
+    if not job: return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify(job_payload(job))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if not get_visible_job(job_id): return jsonify({"success": False, "error": "Job not found"}), 404
+
+    def generate():
+        # The job may run in another process, so poll its row and push only changes
+        last = None
+        deadline = time.time() + JOB_STALE_SECONDS
+        while time.time() < deadline:
+            db.session.expire_all()
+            data = job_payload(db.session.get(Job, job_id))
+            if data["status"] in ('done', 'failed'):
+                yield sse_event(data, data["status"])
+                return
+            snapshot = (data["status"], data["percent"], data["stage"])
+            if snapshot != last:
+                last = snapshot
+                yield sse_event(data, "progress")
+            time.sleep(JOB_POLL_INTERVAL)
+        yield sse_event({"error": "Timed out waiting for job"}, "error")
+
+    return sse_response(generate())
 
 # --- AI HELPER FUNCTIONS ---
 def clean_ai_text(text):
     if not text: return ""
     return text.replace("```html", "").replace("```json", "").replace("```", "").strip()
 
-def get_groq_response(system_prompt, user_prompt, temperature=0.5):
+# --- SHARED LLM CLIENT (one per worker process) ---
+# Building Groq() per request throws away the connection pool, TLS session and DNS lookup.
+# We keep a single client per process instead (re-created after a fork, e.g. gunicorn --preload).
+_groq_client = None
+_groq_client_pid = None
+_groq_client_lock = threading.Lock()
+
+def get_groq_client():
+    global _groq_client, _groq_client_pid
+    if _groq_client is not None and _groq_client_pid == os.getpid():
+        return _groq_client
+    with _groq_client_lock:
+        if _groq_client is None or _groq_client_pid != os.getpid():
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                    keepalive_expiry=120
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            )
+            _groq_client = Groq(
+                api_key=API_KEY,
+                base_url=os.environ.get("GROQ_BASE_URL") or None,
+                http_client=http_client,
+                max_retries=LLM_MAX_RETRIES
+            )
+            _groq_client_pid = os.getpid()
+    return _groq_client
+
+# --- LLM RESPONSE CACHE (memory LRU + optional SQLite tier) ---
+class ResponseCache:
+    def __init__(self, max_size, ttl, db_path=""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.entries = OrderedDict()  # key -> (expires_at, text)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.next_purge = 0
+        if self.db_path:
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, expires_at REAL, response TEXT)")
+            except Exception as e:
+                print(f"LLM Cache DB Error: {e}")
+                self.db_path = ""
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens):
+        raw = json.dumps([model, messages, temperature, max_tokens], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+        row = self._disk_get(key, now)
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # Keep the row's own expiry, not a fresh TTL
+        self._remember(key, row[1], row[0])
+        return row[1]
+
+    def set(self, key, text):
+        expires_at = time.time() + self.ttl
+        self._remember(key, text, expires_at)
+        if self.db_path:
+            try:
+                with sqlite3.connect(self.db_path, timeout=5) as conn:
+                    conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, expires_at, text))
+                    # Drop expired rows now and then so the file does not grow forever
+                    now = time.time()
+                    if now >= self.next_purge:
+                        self.next_purge = now + LLM_CACHE_PURGE_INTERVAL
+                        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            except Exception as e:
+                print(f"LLM Cache DB Error: {e}")
+
+    def _remember(self, key, text, expires_at):
+        with self.lock:
+            self.entries[key] = (expires_at, text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        if not self.db_path: return None
+        try:
+            with sqlite3.connect(self.db_path, timeout=5) as conn:
+                return conn.execute("SELECT expires_at, response FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        except Exception as e:
+            print(f"LLM Cache DB Error: {e}")
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "size": len(self.entries), "disk": bool(self.db_path)
+            }
+
+llm_cache = ResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_DB)
+
+# --- IN-FLIGHT COALESCING (single-flight) ---
+# Concurrent identical prompts in this worker share one upstream call; every waiter gets the same result.
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> {"done": Event, "result": ..., "error": ...}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.upstream_calls += 1
+            else:
+                self.coalesced += 1
+        if is_leader:
+            try:
+                call["result"] = fn()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call["done"].set()
+        else:
+            call["done"].wait()
+        if call["error"]: raise call["error"]
+        return call["result"]
+
+    def stats(self):
+        with self.lock:
+            return {"upstream_calls": self.upstream_calls, "coalesced": self.coalesced, "in_flight": len(self.calls)}
+
+llm_flights = SingleFlight()
+
+def build_messages(system_prompt, user_prompt):
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+def get_groq_response(system_prompt, user_prompt, temperature=0.5, max_tokens=2048, cache=True):
+    # cache=False for tools whose output is expected to vary between identical requests
     if not API_KEY: 
         return "Error: GROQ_API_KEY not found in .env file."
-    try:
-        client = Groq(api_key=API_KEY)
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt}, 
-                {"role": "user", "content": user_prompt}
-            ],
+    messages = build_messages(system_prompt, user_prompt)
+    request_key = ResponseCache.make_key(LLM_MODEL, messages, temperature, max_tokens)
+    if cache:
+        cached = llm_cache.get(request_key)
+        if cached is not None: return cached
+
+    def call_upstream():
+        completion = get_groq_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
             temperature=temperature, 
-            max_tokens=2048
+            max_tokens=max_tokens
         )
-        return completion.choices[0].message.content
+        text = completion.choices[0].message.content
+        if cache and text: llm_cache.set(request_key, text)
+        return text
+
+    try:
+        return llm_flights.do(request_key, call_upstream)
     except Exception as e: 
         logging.error(f"AI Error: {e}")
         return f"AI Service Error: {str(e)}"
 
+# --- STREAMING (Server-Sent Events) ---
+def sse_event(data, event=None):
+    msg = f"event: {event}\n" if event else ""
+    return msg + f"data: {json.dumps(data)}\n\n"
+
+def sse_response(generator):
+    # X-Accel-Buffering stops nginx-style proxies from holding tokens back
+    return Response(
+        stream_with_context(generator),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_groq_tokens(messages, temperature=0.5, max_tokens=2048):
+    stream = get_groq_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def sse_groq_stream(messages, temperature=0.5, on_complete=None, cache=False):
+    """Forwards tokens as 'data' events, then a final 'done' event with the full text."""
+    if not API_KEY:
+        yield sse_event({"error": "GROQ_API_KEY not found in .env file."}, "error")
+        return
+    cache_key = ResponseCache.make_key(LLM_MODEL, messages, temperature, 2048) if cache else None
+    full_text = llm_cache.get(cache_key) if cache_key else None
+    if full_text is None:
+        parts = []
+        try:
+            for token in stream_groq_tokens(messages, temperature):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            logging.error(f"AI Stream Error: {e}")
+            yield sse_event({"error": f"AI Service Error: {str(e)}"}, "error")
+            return
+        full_text = "".join(parts)
+        if cache_key and full_text: llm_cache.set(cache_key, full_text)
+    extra = on_complete(full_text) if on_complete else None
+    yield sse_event({"text": full_text, **(extra or {})}, "done")
+
 # ==============================================================================
 #                               AUTH ROUTES
 # ==============================================================================
@@ -294,16 +1251,22 @@ def admin_dashboard():
 @app.route('/api/stats')
 def get_stats():
     cpu, ram = 0, 0
+    data = {"usage": global_stats, "llm_cache": llm_cache.stats(), "llm_coalescing": llm_flights.stats(), "activity_log": activity_writer.stats(), "cleanup": file_sweeper.stats(), "tts_cache": tts_cache.stats(), "pptx_templates": pptx_templates.stats()}
     if session.get('is_admin', False):
         try: 
             cpu = psutil.cpu_percent(interval=None)
             ram = psutil.virtual_memory().percent
         except: pass
-    return jsonify({"cpu": cpu, "ram": ram, "usage": global_stats})
+        # Database-backed figures only for the admin; every open tab polls this endpoint
+        data["artifacts"] = artifact_stats()
+        data["jobs"] = job_dispatcher.stats()
+    return jsonify({"cpu": cpu, "ram": ram, **data})
 
 # --- NEW: API to fetch Users for the Admin "Users" Tab ---
-# In app.py, find the @app.route('/api/users') function
-# Make sure it looks EXACTLY like this:
+# One GROUP BY over activity_log joined to user (no per-user queries).
+# Query params: page, per_page (both optional; omit them to get every user), sort (id|username|last_seen|action_count), order (asc|desc).
+# The body stays a plain list for the dashboard; the total is sent in X-Total-Count.
+USER_SORT_FIELDS = {"id", "username", "last_seen", "action_count"}
 
 @app.route('/api/users')
 def get_users_list():
@@ -311,85 +1274,215 @@ def get_users_list():
         return jsonify({"error": "Unauthorized"}), 403
     
     try:
-        users = User.query.all()
-        data = []
-        for user in users:
-            # Last Active Logic
-            last_log = ActivityLog.query.filter_by(user_id=user.id).order_by(ActivityLog.timestamp.desc()).first()
-            last_seen = "Never"
-            if last_log:
-                last_seen = last_log.timestamp.strftime("%Y-%m-%d %H:%M")
-            
-            # Action Count
-            action_count = ActivityLog.query.filter_by(user_id=user.id).count()
+        # Without page/per_page every user is returned (the dashboard's Users tab relies on this)
+        paged = 'page' in request.args or 'per_page' in request.args
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 100, type=int), 1), 500)
+        sort = request.args.get('sort', 'id')
+        if sort not in USER_SORT_FIELDS: sort = 'id'
+        descending = request.args.get('order', 'asc') == 'desc'
+
+        activity = db.session.query(
+            ActivityLog.user_id.label('user_id'),
+            func.max(ActivityLog.timestamp).label('last_seen'),
+            func.count(ActivityLog.id).label('action_count')
+        ).filter(ActivityLog.user_id.isnot(None)).group_by(ActivityLog.user_id).subquery()
+
+        action_count = func.coalesce(activity.c.action_count, 0)
+        columns = {
+            "id": User.id, "username": User.username,
+            "last_seen": activity.c.last_seen, "action_count": action_count
+        }
+        sort_col = columns[sort].desc() if descending else columns[sort].asc()
 
-            # --- THIS PART IS CRITICAL FOR FIXING "UNDEFINED" ---
+        query = db.session.query(User.id, User.username, activity.c.last_seen, action_count.label('action_count')) \
+            .outerjoin(activity, activity.c.user_id == User.id)
+        total = User.query.count()
+        query = query.order_by(sort_col, User.id)
+        if paged: query = query.limit(per_page).offset((page - 1) * per_page)
+        rows = query.all()
+
+        data = []
+        for row in rows:
             data.append({
-                "id": user.id,
-                "username": user.username,
-                "full_name": user.full_name or "N/A",   # <--- Must be here
-                "department": user.department or "N/A", # <--- Must be here
-                "last_seen": last_seen,
-                "action_count": action_count
+                "id": row.id,
+                "username": row.username,
+                # The User model has no profile columns yet
+                "full_name": "N/A",
+                "department": "N/A",
+                "last_seen": row.last_seen.strftime("%Y-%m-%d %H:%M") if row.last_seen else "Never",
+                "action_count": row.action_count
             })
-            # ----------------------------------------------------
 
-        return jsonify(data)
+        response = jsonify(data)
+        response.headers['X-Total-Count'] = str(total)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# --- ACTIVITY LOG QUERIES (shared by the Activity tab and exports) ---
+def parse_log_datetime(value, is_end=False):
+    # Accepts YYYY-MM-DD or a full ISO timestamp; a bare end date includes that whole day
+    if not value: return None
+    parsed = datetime.datetime.fromisoformat(value)
+    if is_end and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+def filtered_activity_logs(args):
+    """Activity rows joined to their username, newest first, filtered by user/action/start/end."""
+    query = db.session.query(
+        ActivityLog.id, ActivityLog.timestamp, ActivityLog.activity_type, ActivityLog.details, User.username
+    ).outerjoin(User, ActivityLog.user_id == User.id)
+
+    if args.get('user'):
+        query = query.filter(User.username == args.get('user'))
+    if args.get('action'):
+        query = query.filter(ActivityLog.activity_type == args.get('action'))
+    start = parse_log_datetime(args.get('start'))
+    end = parse_log_datetime(args.get('end'), is_end=True)
+    if start: query = query.filter(ActivityLog.timestamp >= start)
+    if end: query = query.filter(ActivityLog.timestamp < end)
+    return query.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+
+def encode_log_cursor(row):
+    raw = f"{row.timestamp.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_log_cursor(cursor):
+    ts, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.datetime.fromisoformat(ts), int(log_id)
+
+def after_log_cursor(query, cursor):
+    # Rows strictly older than the cursor in (timestamp, id) order
+    ts, log_id = decode_log_cursor(cursor)
+    return query.filter(tuple_(ActivityLog.timestamp, ActivityLog.id) < (ts, log_id))
+
 # --- NEW: API to fetch Activity Logs for the Admin "Activity" Tab ---
+# Keyset pagination on (timestamp, id): pass the X-Next-Cursor header back as ?cursor= for the next page.
+# Filters: user (username), action (activity type), start / end (ISO dates).
 @app.route('/api/activity-logs')
 def get_activity_logs_json():
     if not session.get('is_admin'): 
         return jsonify({"error": "Unauthorized"}), 403
     
     try:
-        # Get last 100 logs
-        logs = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(100).all()
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        query = filtered_activity_logs(request.args)
+        if request.args.get('cursor'): query = after_log_cursor(query, request.args['cursor'])
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or date filter"}), 400
+
+    try:
+        # Fetch one extra row to know whether another page exists
+        rows = query.limit(limit + 1).all()
         data = []
-        for log in logs:
-            username = log.user.username if log.user else "Admin/Guest"
+        for row in rows[:limit]:
             data.append({
-                "date": log.timestamp.strftime("%Y-%m-%d %H:%M"),
-                "user": username,
-                "action": log.activity_type,
-                "details": log.details
+                "date": row.timestamp.strftime("%Y-%m-%d %H:%M"),
+                "user": row.username or "Admin/Guest",
+                "action": row.activity_type,
+                "details": row.details
             })
-        return jsonify(data)
+        response = jsonify(data)
+        if len(rows) > limit:
+            response.headers['X-Next-Cursor'] = encode_log_cursor(rows[limit - 1])
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# --- STREAMING REPORT EXPORT ---
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    "txt": ("text/plain", "txt"),
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+def iter_report_rows(args, limit=None):
+    # yield_per + stream_results keeps only one batch of rows in memory at a time
+    query = filtered_activity_logs(args).execution_options(stream_results=True)
+    if limit: query = query.limit(limit)
+    return query.yield_per(1000)
+
+def render_report_chunks(fmt, rows, header=""):
+    buf = StringIO()
+    buf.write(header)
+    writer = csv.writer(buf)
+    if fmt == "csv":
+        writer.writerow(["timestamp", "user", "action", "details"])
+    for row in rows:
+        username = row.username or "Admin/Guest"
+        if fmt == "csv":
+            writer.writerow([row.timestamp.isoformat(sep=' '), username, row.activity_type, row.details])
+        elif fmt == "jsonl":
+            buf.write(json.dumps({
+                "timestamp": row.timestamp.isoformat(sep=' '), "user": username,
+                "action": row.activity_type, "details": row.details
+            }) + "\n")
+        else:
+            buf.write(f"{str(row.timestamp):<25} | {username:<20} | {row.activity_type:<20} | {row.details}\n")
+        if buf.tell() >= EXPORT_CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data: yield data
+    yield compressor.flush()
+
+# Query params: format (txt|csv|jsonl), gzip=1, limit, plus the /api/activity-logs filters (user, action, start, end).
+# The plain-text summary keeps its "last 100 actions" default; csv/jsonl dump every matching row.
 @app.route('/download-report')
 def download_report():
     if not session.get('is_admin'): return "Unauthorized", 401
     
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Fetch real activity logs from DB
+    fmt = request.args.get('format', 'txt')
+    if fmt not in EXPORT_FORMATS: return "Unsupported format", 400
+    limit = request.args.get('limit', 100 if fmt == 'txt' else None, type=int)
     try:
-        logs = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(100).all()
-    except:
-        logs = []
-    
-    report_text = f"AI WORKSPACE - SYSTEM REPORT\nGenerated: {now}\n\n"
-    
-    report_text += "--- USAGE SUMMARY ---\n"
-    for k, v in global_stats.items():
-        report_text += f"{k.replace('_', ' ').title()}: {v}\n"
-    
-    report_text += "\n--- RECENT USER ACTIVITY (Last 100 Actions) ---\n"
-    report_text += f"{'TIMESTAMP':<25} | {'USER':<20} | {'ACTION':<20} | {'DETAILS'}\n"
-    report_text += "-" * 100 + "\n"
-    
-    for log in logs:
-        username = log.user.username if log.user else "Admin/Guest"
-        report_text += f"{str(log.timestamp):<25} | {username:<20} | {log.activity_type:<20} | {log.details}\n"
-    
+        parse_log_datetime(request.args.get('start'))
+        parse_log_datetime(request.args.get('end'))
+    except ValueError:
+        return "Invalid date filter", 400
+
+    header = ""
+    if fmt == "txt":
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        header = f"AI WORKSPACE - SYSTEM REPORT\nGenerated: {now}\n\n"
+        header += "--- USAGE SUMMARY ---\n"
+        for k, v in global_stats.items():
+            header += f"{k.replace('_', ' ').title()}: {v}\n"
+        scope = f"Last {limit} Actions" if limit else "All Actions"
+        header += f"\n--- RECENT USER ACTIVITY ({scope}) ---\n"
+        header += f"{'TIMESTAMP':<25} | {'USER':<20} | {'ACTION':<20} | {'DETAILS'}\n"
+        header += "-" * 100 + "\n"
+
+    args = request.args.copy()
+    def generate():
+        try:
+            rows = iter_report_rows(args, limit)
+        except Exception as e:
+            print(f"Report Error: {e}")
+            rows = []
+        yield from render_report_chunks(fmt, rows, header)
+
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    filename = f"System_Report.{ext}"
+    body = generate()
+    if request.args.get('gzip') == '1':
+        body = gzip_chunks(body)
+        mimetype, filename = "application/gzip", filename + ".gz"
+
     return Response(
-        report_text, 
-        mimetype="text/plain", 
-        headers={"Content-disposition": "attachment; filename=System_Report.txt"}
+        stream_with_context(body), 
+        mimetype=mimetype, 
+        headers={"Content-disposition": f"attachment; filename={filename}"}
     )
 
 # ==============================================================================
@@ -405,66 +1498,265 @@ def serve_static_files(filename):
 #                               AI TOOLS
 # ==============================================================================
 
+# Cookie sessions are written before a streamed body starts, so /chat/stream hands the
+# finished turn back as a signed token and the browser commits it via /chat/commit.
+chat_turn_serializer = URLSafeTimedSerializer(app.secret_key, salt="chat-turn")
+CHAT_SYSTEM_MSG = {"role": "system", "content": "You are a helpful AI assistant."}
+
+def append_chat_turn(user_msg, ai_reply):
+    history = session.get('chat_history', [])
+    history.append({"role": "user", "content": user_msg})
+    history.append({"role": "assistant", "content": ai_reply})
+    if len(history) > 6: history = history[-6:]
+    session['chat_history'] = history
+
 @app.route('/chat', methods=['POST'])
 def chat():
     log_activity('chat_msgs', 'User sent a chat message')
     msg = request.form.get('message', '')
     history = session.get('chat_history', [])
-    sys_msg = {"role": "system", "content": "You are a helpful AI assistant."}
     try:
-        messages = [sys_msg] + history + [{"role": "user", "content": msg}]
-        client = Groq(api_key=API_KEY)
-        completion = client.chat.completions.create(model="llama-3.3-70b-versatile", messages=messages, temperature=0.7)
+        messages = [CHAT_SYSTEM_MSG] + history + [{"role": "user", "content": msg}]
+        client = get_groq_client()
+        completion = client.chat.completions.create(model=LLM_MODEL, messages=messages, temperature=0.7)
         ai_reply = completion.choices[0].message.content
-        history.append({"role": "user", "content": msg})
-        history.append({"role": "assistant", "content": ai_reply})
-        if len(history) > 6: history = history[-6:]
-        session['chat_history'] = history
+        append_chat_turn(msg, ai_reply)
         return jsonify({"success": True, "response": ai_reply})
     except Exception as e: return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    log_activity('chat_msgs', 'User sent a chat message')
+    msg = request.form.get('message', '')
+    history = session.get('chat_history', [])
+    messages = [CHAT_SYSTEM_MSG] + history + [{"role": "user", "content": msg}]
+
+    def sign_turn(ai_reply):
+        return {"commit_token": chat_turn_serializer.dumps({"user": msg, "assistant": ai_reply})}
+
+    return sse_response(sse_groq_stream(messages, temperature=0.7, on_complete=sign_turn))
+
+@app.route('/chat/commit', methods=['POST'])
+def chat_commit():
+    try:
+        turn = chat_turn_serializer.loads(request.form.get('commit_token', ''), max_age=600)
+    except BadSignature:
+        return jsonify({"success": False, "error": "Invalid chat token"}), 400
+    append_chat_turn(turn['user'], turn['assistant'])
+    return jsonify({"success": True})
+
 @app.route('/clear-chat', methods=['POST'])
 def clear_chat():
     session.pop('chat_history', None)
     return jsonify({"success": True})
 
+# --- TEXT TOOL PROMPTS (shared by the JSON and /stream variants) ---
+def minutes_prompt(form):
+    return "Convert notes to minutes.", form.get('notes', '')
+
+def email_prompt(form):
+    return "Write a professional email.", f"To: {form.get('recipient')} Topic: {form.get('topic')}"
+
+def review_prompt(form):
+    return "Review code.", form.get('code', '')
+
+def translate_prompt(form):
+    return f"Translate to {form.get('target_language')}.", form.get('text')
+
 @app.route('/generate-minutes', methods=['POST'])
 def generate_minutes():
     log_activity('text_gen', 'Generated Meeting Minutes')
-    notes = request.form.get('notes', '')
-    res = get_groq_response("Convert notes to minutes.", notes)
+    res = get_groq_response(*minutes_prompt(request.form))
     return jsonify({"success": True, "minutes": res})
 
 @app.route('/generate-email', methods=['POST'])
 def generate_email():
     log_activity('text_gen', 'Generated Email Draft')
-    recipient = request.form.get('recipient')
-    topic = request.form.get('topic')
-    res = get_groq_response("Write a professional email.", f"To: {recipient} Topic: {topic}")
+    res = get_groq_response(*email_prompt(request.form))
     return jsonify({"success": True, "email_content": res})
 
 @app.route('/review-code', methods=['POST'])
 def review_code():
     log_activity('code_review', 'Performed Code Review')
-    code = request.form.get('code', '')
-    res = get_groq_response("Review code.", code)
+    res = get_groq_response(*review_prompt(request.form))
     return jsonify({"success": True, "review": res})
 
 @app.route('/translate', methods=['POST'])
 def translate():
-    target = request.form.get('target_language')
-    log_activity('text_gen', f'Translated text to {target}')
-    text = request.form.get('text')
-    res = get_groq_response(f"Translate to {target}.", text)
+    log_activity('text_gen', f'Translated text to {request.form.get("target_language")}')
+    res = get_groq_response(*translate_prompt(request.form))
     return jsonify({"success": True, "translation": res})
 
-@app.route('/generate-quiz', methods=['POST'])
-def generate_quiz():
-    log_activity('quiz_gen', 'Generated a Quiz')
-    
-    topic = request.form.get('topic', 'General Knowledge')
-    count = request.form.get('count', '5')
-    
+@app.route('/generate-minutes/stream', methods=['POST'])
+def generate_minutes_stream():
+    log_activity('text_gen', 'Generated Meeting Minutes')
+    return sse_response(sse_groq_stream(build_messages(*minutes_prompt(request.form)), cache=True))
+
+@app.route('/generate-email/stream', methods=['POST'])
+def generate_email_stream():
+    log_activity('text_gen', 'Generated Email Draft')
+    return sse_response(sse_groq_stream(build_messages(*email_prompt(request.form)), cache=True))
+
+@app.route('/review-code/stream', methods=['POST'])
+def review_code_stream():
+    log_activity('code_review', 'Performed Code Review')
+    return sse_response(sse_groq_stream(build_messages(*review_prompt(request.form)), cache=True))
+
+@app.route('/translate/stream', methods=['POST'])
+def translate_stream():
+    log_activity('text_gen', f'Translated text to {request.form.get("target_language")}')
+    return sse_response(sse_groq_stream(build_messages(*translate_prompt(request.form)), cache=True))
+
+# ==============================================================================
+#                           PDF RENDERING SERVICE
+# ==============================================================================
+
+# Quiz rules ride along with xhtml2pdf's own stylesheet so they are parsed once per worker.
+# @page stays in the document: page templates are registered on each render's context.
+QUIZ_PAGE_CSS = "@page { size: A4; margin: 2cm; }"
+QUIZ_CSS = """
+body { font-family: Helvetica, sans-serif; font-size: 12px; color: #000; line-height: 1.4; }
+h1 { text-align: center; color: #4f46e5; border-bottom: 2px solid #eee; padding-bottom: 10px; margin-bottom: 20px; }
+.question-box { margin-bottom: 10px; page-break-inside: avoid; }
+.q-title { font-size: 14px; font-weight: bold; margin-bottom: 5px; color: #333; }
+ul.options-list { margin: 0; padding-left: 20px; list-style-type: none; }
+li { margin-bottom: 2px; padding: 2px 0; }
+h4 { margin-top: 20px; border-bottom: 1px solid #ccc; }
+table.answer-key { width: 100%; border-collapse: collapse; margin-top: 10px; font-size: 11px; }
+th, td { border: 1px solid #999; padding: 5px; text-align: left; }
+th { background-color: #f0f0f0; }
+"""
+
+parsed_default_css = {}
+parse_css_source = getattr(pisaContext, '_parseCSSSource', None)
+
+def parse_css_source_cached(context, text, source_name):
+    # Default stylesheets have no @page/@font-face, so their parse has no side effects on the context
+    if source_name != DEFAULT_CSS_SOURCE:
+        return parse_css_source(context, text, source_name)
+    if text not in parsed_default_css:
+        parsed_default_css[text] = parse_css_source(context, text, source_name)
+    return parsed_default_css[text]
+
+# Private xhtml2pdf API (checked against the version pinned in requirements.txt): skip the cache if it moved
+if parse_css_source and DEFAULT_CSS_SOURCE:
+    pisaContext._parseCSSSource = parse_css_source_cached
+
+def render_pdf_bytes(html, css=None):
+    out = BytesIO()
+    if css and DEFAULT_CSS is None:
+        # No library stylesheet to extend: fall back to an inline <style> block
+        html, css = f"<style>{css}</style>{html}", None
+    pisa.CreatePDF(BytesIO(html.encode('utf-8')), dest=out, default_css=DEFAULT_CSS + css if css else None)
+    return out.getvalue()
+
+class PDFRenderTimeout(BaseException):
+    # BaseException so pisa's own `except Exception` handlers can't swallow it and carry on rendering
+    pass
+
+def raise_render_timeout(signum, frame):
+    raise PDFRenderTimeout()
+
+def init_pdf_worker(memory_limit_mb):
+    # Cap growth beyond what the freshly imported worker already maps, then warm fonts and reportlab caches
+    if resource and memory_limit_mb:
+        limit = psutil.Process().memory_info().vms + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if hasattr(signal, 'SIGALRM'): signal.signal(signal.SIGALRM, raise_render_timeout)
+    render_pdf_bytes("<p>warm-up</p>")
+    render_pdf_bytes("<p>warm-up</p>", css=QUIZ_CSS)
+
+def render_pdf_in_worker(html, css, timeout):
+    # Watchdog for this render only: the alarm interrupts pisa's pure-Python loop, the worker survives
+    # and nothing else in the pool is touched. Time spent queued never counts.
+    if not hasattr(signal, 'SIGALRM'): return render_pdf_bytes(html, css)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return render_pdf_bytes(html, css)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+def pdf_worker_ready():
+    return True
+
+class PDFRenderer:
+    """Renders HTML to PDF bytes on a warm process pool with a per-document timeout."""
+
+    def __init__(self, workers, timeout, queue_timeout, memory_limit_mb):
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+
+    def _new_pool(self):
+        pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_pdf_worker,
+            initargs=(self.memory_limit_mb,)
+        )
+        # Workers are spawned on demand, one per submit: fill the pool now so no request pays the spawn
+        for _ in range(self.workers): pool.submit(pdf_worker_ready)
+        return pool
+
+    def ensure_started(self):
+        if not PDF_POOL_ENABLED or multiprocessing.parent_process() is not None: return
+        self._get_pool()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid():
+                self.pool = self._new_pool()
+                self.pid = os.getpid()
+            return self.pool
+
+    def _replace(self, broken):
+        # A worker died (OOM kill, segfault): the executor is unusable, so swap in a fresh, warm one
+        with self.lock:
+            if self.pool is not broken: return
+            self.pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, html, css=None):
+        # Job workers are already off the request path; they render in-process
+        if not PDF_POOL_ENABLED or multiprocessing.parent_process() is not None:
+            return render_pdf_bytes(html, css)
+        pool = self._get_pool()
+        future = pool.submit(render_pdf_in_worker, html, css, self.timeout)
+        try:
+            return future.result(timeout=self.timeout + self.queue_timeout)
+        except PDFRenderTimeout:
+            raise RuntimeError(f"PDF rendering took longer than {self.timeout:g}s")
+        except MemoryError:
+            raise RuntimeError("PDF renderer ran out of memory")
+        except FuturesTimeout:
+            # Still queued behind other renders (or wedged outside Python): give up on this one only
+            future.cancel()
+            raise RuntimeError("PDF renderer is busy, please try again")
+        except BrokenProcessPool:
+            self._replace(pool)
+            raise RuntimeError("PDF rendering was interrupted by a renderer restart, please try again")
+
+pdf_renderer = PDFRenderer(PDF_WORKERS, PDF_TIMEOUT, PDF_QUEUE_TIMEOUT, PDF_MEMORY_LIMIT_MB)
+
+def pdf_response(pdf_bytes, download_name):
+    # Bytes body, so Flask sets Content-Length; the ETag lets clients skip re-downloading identical output
+    response = Response(pdf_bytes, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    response.set_etag(hashlib.sha256(pdf_bytes).hexdigest())
+    return response
+
+# ==============================================================================
+#               HEAVY MEDIA TASKS (run inline, or in the job pool with async=1)
+# ==============================================================================
+# Each task takes plain JSON-able arguments, raises on failure and returns the response fields.
+# "artifact" names a generated file that still has to be registered for cleanup.
+
+def task_generate_quiz(topic, count, progress=NullProgress()):
     # 1. Strict HTML Prompt to AI
     prompt = (
         f"Create a {count}-question Multiple Choice Quiz about '{topic}'.\n"
@@ -483,28 +1775,17 @@ def generate_quiz():
         "<table class='answer-key'>...</table>"
     )
     
-    raw_res = get_groq_response("You are a strict HTML quiz generator.", prompt)
-    if not raw_res: return jsonify({"success": False, "error": "AI Failed"})
+    progress.update(5, "Writing questions")
+    raw_res = get_groq_response("You are a strict HTML quiz generator.", prompt, cache=False)
+    if not raw_res: raise RuntimeError("AI Failed")
     
     clean_html = clean_ai_text(raw_res)
     
-    # 2. PDF CSS Wrapper
+    # 2. PDF Wrapper (stylesheet is QUIZ_CSS, parsed once per worker)
     pdf_html = f"""
     <html>
     <head>
-        <style>
-            @page {{ size: A4; margin: 2cm; }}
-            body {{ font-family: Helvetica, sans-serif; font-size: 12px; color: #000; line-height: 1.4; }}
-            h1 {{ text-align: center; color: #4f46e5; border-bottom: 2px solid #eee; padding-bottom: 10px; margin-bottom: 20px; }}
-            .question-box {{ margin-bottom: 10px; page-break-inside: avoid; }}
-            .q-title {{ font-size: 14px; font-weight: bold; margin-bottom: 5px; color: #333; }}
-            ul.options-list {{ margin: 0; padding-left: 20px; list-style-type: none; }}
-            li {{ margin-bottom: 2px; padding: 2px 0; }}
-            h4 {{ margin-top: 20px; border-bottom: 1px solid #ccc; }}
-            table.answer-key {{ width: 100%; border-collapse: collapse; margin-top: 10px; font-size: 11px; }}
-            th, td {{ border: 1px solid #999; padding: 5px; text-align: left; }}
-            th {{ background-color: #f0f0f0; }}
-        </style>
+        <style>{QUIZ_PAGE_CSS}</style>
     </head>
     <body>
         <h1>Quiz: {topic}</h1>
@@ -516,30 +1797,144 @@ def generate_quiz():
     fname = f"quiz_{uuid.uuid4().hex[:8]}.pdf"
     path = os.path.join(STATIC_FOLDER, fname)
     
-    try:
-        with open(path, "w+b") as f:
-            pisa.CreatePDF(BytesIO(pdf_html.encode('utf-8')), dest=f)
-        return jsonify({"success": True, "quiz": clean_html, "file_url": f"/static/{fname}"})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    progress.update(60, "Rendering PDF")
+    pdf_bytes = pdf_renderer.render(pdf_html, css=QUIZ_CSS)
+    with open(path, "w+b") as f:
+        f.write(pdf_bytes)
+    return {"quiz": clean_html, "file_url": f"/static/{fname}", "artifact": fname}
 
-@app.route('/make-ppt', methods=['POST'])
-def make_ppt():
-    # 1. Get Data from Request
-    topic = request.form.get('topic', 'Presentation')
-    source_text = request.form.get('source_text', '') # <--- NOW USING YOUR INPUT TEXT
+# --- PPTX TEMPLATE CACHE ---
+class PPTXTemplateCache:
+    """Uploaded templates stored once by SHA-256 on disk, with parsed copies kept per process (LRU by file size)."""
 
-    log_activity('text_gen', f'Generated PPT: {topic}')
-    
+    def __init__(self, folder, max_bytes, store_max_bytes, keep=lambda: set()):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.store_max_bytes = store_max_bytes
+        self.keep = keep  # keys the store must never evict
+        self.lock = threading.Lock()
+        self.parsed = OrderedDict()  # sha256 -> (file size, Presentation)
+        self.parsed_bytes = 0
+        self.pinned = set()  # parsed entries exempt from LRU eviction
+        self.hits = 0
+        self.misses = 0
+        self.uploads_deduplicated = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f"{key}.pptx")
+
+    def add_upload(self, file):
+        """Stores an uploaded template unless the same bytes are already stored. Returns its key."""
+        stream = file.stream
+        if isinstance(stream, UploadStream):
+            key = stream.sha256.hexdigest()  # hashed while it was spooled
+        else:
+            stream.seek(0)
+            key = hashlib.sha256(stream.read()).hexdigest()
+        path = self.path_for(key)
+        if os.path.exists(path):
+            os.utime(path)  # mark as recently used
+            with self.lock: self.uploads_deduplicated += 1
+            return key
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            claim_upload(file, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+        self.evict_store()
+        return key
+
+    def parsed_template(self, key, pin=False):
+        """Returns the shared parsed template; treat it as read-only."""
+        with self.lock:
+            if pin: self.pinned.add(key)
+            entry = self.parsed.get(key)
+            if entry:
+                self.parsed.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry: return entry[1]
+        path = self.path_for(key)
+        prs = Presentation(path)
+        size = os.path.getsize(path)
+        with self.lock:
+            if key not in self.parsed:
+                self.parsed[key] = (size, prs)
+                self.parsed_bytes += size
+            while self.parsed_bytes > self.max_bytes:
+                victim = next((k for k in self.parsed if k not in self.pinned), None)
+                if victim is None or victim == key: break
+                old_size, _ = self.parsed.pop(victim)
+                self.parsed_bytes -= old_size
+            return self.parsed[key][1]
+
+    def open(self, key, pin=False):
+        """Returns a private copy of the parsed template; callers may add slides freely."""
+        return copy.deepcopy(self.parsed_template(key, pin))
+
+    def unpin(self, key):
+        with self.lock: self.pinned.discard(key)
+
+    def discard(self, key):
+        with self.lock:
+            entry = self.parsed.pop(key, None)
+            if entry: self.parsed_bytes -= entry[0]
+            self.pinned.discard(key)
+        try: os.remove(self.path_for(key))
+        except OSError: pass
+
+    def evict_store(self):
+        entries = []
+        keep = self.keep()
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith('.pptx') and entry.name[:-5] not in keep:
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.store_max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError: pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "parsed": len(self.parsed), "pinned": len(self.pinned), "parsed_bytes": self.parsed_bytes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0, "uploads_deduplicated": self.uploads_deduplicated
+            }
+
+def library_template_keys():
+    return {key for (key,) in db.session.query(PresentationTemplate.sha256)}
+
+pptx_templates = PPTXTemplateCache(os.path.join(STATIC_FOLDER, "pptx_templates"), PPTX_TEMPLATE_CACHE_MAX_BYTES, PPTX_TEMPLATE_STORE_MAX_BYTES, keep=library_template_keys)
+
+def index_layouts(prs):
+    """Lists each layout's placeholders and picks the one to use for title + bullet slides."""
+    layouts, object_layout, body_layout = [], None, None
+    for i, layout in enumerate(prs.slide_layouts):
+        kinds = {ph.placeholder_format.idx: ph.placeholder_format.type.name for ph in layout.placeholders}
+        layouts.append({"index": i, "name": layout.name, "placeholders": sorted(set(kinds.values()))})
+        # Bullets go into placeholder idx 1, the title into idx 0
+        if kinds.get(0) not in ("TITLE", "CENTER_TITLE"): continue
+        if kinds.get(1) == "OBJECT" and object_layout is None: object_layout = i
+        if kinds.get(1) == "BODY" and body_layout is None: body_layout = i
+    fallback = 1 if len(layouts) > 1 else 0
+    return layouts, next((i for i in (object_layout, body_layout) if i is not None), fallback)
+
+def task_make_ppt(topic, source_text, template_key=None, layout_index=None, pin_template=False, progress=NullProgress()):
     # 2. Handle Template (Optional)
-    template = request.files.get('template_file')
     prs = Presentation()
-    if template:
-        t_path = os.path.join(STATIC_FOLDER, f"temp_{uuid.uuid4()}.pptx")
-        template.save(t_path)
-        try: prs = Presentation(t_path)
+    if template_key:
+        try: prs = pptx_templates.open(template_key, pin=pin_template)
         except: prs = Presentation()
-        if os.path.exists(t_path): os.remove(t_path)
+    if layout_index is None or layout_index >= len(prs.slide_layouts):
+        layout_index = 1 if len(prs.slide_layouts) > 1 else 0
     
     # 3. Build Stronger AI Prompt
     # We combine the topic and the detailed source text
@@ -556,19 +1951,20 @@ def make_ppt():
     )
 
     # 4. Get AI Response
-    ai_text = get_groq_response(system_instruction, content_input)
+    progress.update(10, "Writing slides")
+    ai_text = get_groq_response(system_instruction, content_input, cache=False)
     clean_response = clean_ai_text(ai_text)
     
     # 5. Parse and Build Slides
+    progress.update(70, "Building presentation")
     slide = None
     for line in clean_response.split('\n'):
         line = line.strip()
         
         # Check for Slide Title (Case Insensitive)
         if line.upper().startswith("SLIDE:") or line.upper().startswith("SLIDE "):
-            # Create a new slide (Layout 1 is usually Title + Content)
-            layout = prs.slide_layouts[1] if len(prs.slide_layouts) > 1 else prs.slide_layouts[0]
-            slide = prs.slides.add_slide(layout)
+            # Create a new slide (Layout 1 is usually Title + Content; library templates index the right one)
+            slide = prs.slides.add_slide(prs.slide_layouts[layout_index])
             
             # Extract title text
             title_text = line.split(':', 1)[-1].strip() if ':' in line else line
@@ -596,7 +1992,403 @@ def make_ppt():
     save_path = os.path.join(STATIC_FOLDER, fname)
     prs.save(save_path)
     
-    return jsonify({"success": True, "file_url": f"/static/{fname}"})
+    return {"file_url": f"/static/{fname}", "artifact": fname}
+
+# --- TRANSCRIPTION ---
+def recognize_google(audio, language):
+    return sr.Recognizer().recognize_google(audio, language=language)
+
+# Pluggable recognizers: name -> fn(AudioData, language) -> text. Pick one with TRANSCRIBE_BACKEND.
+TRANSCRIBERS = {
+    "google": recognize_google,
+}
+
+def split_on_silence(audio, min_seconds=TRANSCRIBE_CHUNK_MIN_SECONDS, max_seconds=TRANSCRIBE_CHUNK_MAX_SECONDS, window=0.05):
+    """Splits AudioData into [(start_sec, end_sec, AudioData)], cutting at the quietest window in each span."""
+    width, rate = audio.sample_width, audio.sample_rate
+    raw = audio.get_raw_data()
+    total = len(raw) // width
+    if total <= max_seconds * rate:
+        return [(0.0, total / rate, audio)]
+
+    # RMS loudness per window (AudioFile sources are mono; 24-bit is read via its top two bytes)
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}.get(width)
+    if dtype is not None:
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    else:
+        samples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, width)[:, -2:].copy().view(np.int16).ravel().astype(np.float32)
+    win = max(int(window * rate), 1)
+    usable = len(samples) // win * win
+    rms = np.sqrt(np.mean(samples[:usable].reshape(-1, win) ** 2, axis=1))
+
+    cuts, start = [0], 0
+    while total - start > max_seconds * rate:
+        lo = (start + int(min_seconds * rate)) // win
+        hi = min((start + int(max_seconds * rate)) // win, len(rms))
+        cut = (lo + int(np.argmin(rms[lo:hi]))) * win if hi > lo else start + int(max_seconds * rate)
+        cuts.append(cut)
+        start = cut
+    cuts.append(total)
+
+    return [
+        (a / rate, b / rate, sr.AudioData(raw[a * width:b * width], rate, width))
+        for a, b in zip(cuts, cuts[1:])
+    ]
+
+def transcribe_segments(segments, language, recognize, progress=NullProgress(), start_percent=10):
+    """Recognizes segments on a bounded thread pool and yields (index, segment dict) as each finishes."""
+    def run(item):
+        seg_start, seg_end, chunk = item
+        try: text = recognize(chunk, language)
+        except sr.UnknownValueError: text = ""  # silence or unintelligible speech
+        return {"start": round(seg_start, 2), "end": round(seg_end, 2), "text": text}
+
+    with ThreadPoolExecutor(max_workers=min(TRANSCRIBE_WORKERS, len(segments)) or 1) as pool:
+        futures = {pool.submit(run, item): i for i, item in enumerate(segments)}
+        for done, future in enumerate(as_completed(futures), 1):
+            progress.update(start_percent + (100 - start_percent) * done / len(segments), "Transcribing")
+            yield futures[future], future.result()
+
+def iter_transcript(path, language, progress=NullProgress()):
+    """Yields transcript segments in order, each as soon as it and everything before it is done. Deletes path."""
+    try:
+        progress.update(5, "Reading audio")
+        r = sr.Recognizer()
+        with sr.AudioFile(path) as src:
+            audio = r.record(src)
+        segments = split_on_silence(audio)
+        finished, next_index = {}, 0
+        for index, segment in transcribe_segments(segments, language, TRANSCRIBERS[TRANSCRIBE_BACKEND], progress):
+            finished[index] = segment
+            while next_index in finished:
+                yield {"index": next_index, **finished.pop(next_index)}
+                next_index += 1
+    finally:
+        if os.path.exists(path): os.remove(path)
+
+def task_audio_to_text(path, language, progress=NullProgress()):
+    results = [{k: v for k, v in seg.items() if k != "index"} for seg in iter_transcript(path, language, progress)]
+    txt = " ".join(seg["text"] for seg in results if seg["text"])
+    return {"text": txt, "segments": results}
+
+# Audio codecs that can be copied out as-is, and the container each one is served in
+STREAM_COPY_CONTAINERS = {"mp3": "mp3", "aac": "m4a"}
+
+def probe_media(path):
+    """Returns (first audio codec or None, duration in seconds or None) from ffmpeg's stream listing."""
+    proc = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", path], capture_output=True, text=True)
+    codec = re.search(r"Stream #\S+.*?: Audio: (\w+)", proc.stderr)
+    duration = re.search(r"Duration: (\d+):(\d+):([\d.]+)", proc.stderr)
+    seconds = None
+    if duration:
+        h, m, sec = duration.groups()
+        seconds = int(h) * 3600 + int(m) * 60 + float(sec)
+    return (codec.group(1) if codec else None), seconds
+
+def extract_audio_ffmpeg(vid_path, progress):
+    """Demuxes the audio track without touching the video stream; transcodes only if the codec can't be copied."""
+    codec, duration = probe_media(vid_path)
+    if not codec: raise ValueError("Video has no audio track")
+    ext = STREAM_COPY_CONTAINERS.get(codec)
+    codec_args = ["-c:a", "copy"] if ext else ["-c:a", "libmp3lame", "-q:a", "2"]
+    audio_name = f"extracted_{uuid.uuid4().hex[:8]}.{ext or 'mp3'}"
+    audio_path = os.path.join(STATIC_FOLDER, audio_name)
+
+    progress.update(5, "Copying audio track" if ext else "Converting audio")
+    proc = subprocess.Popen(
+        [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", vid_path,
+         "-vn", "-map", "0:a:0", *codec_args, "-progress", "pipe:1", audio_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    for line in proc.stdout:
+        # -progress prints key=value lines; out_time_us is how far into the input ffmpeg has got
+        if line.startswith("out_time_us=") and duration:
+            try: progress.update(5 + 95 * int(line.split("=", 1)[1]) / 1e6 / duration)
+            except ValueError: pass
+    errors = proc.stderr.read()
+    if proc.wait() != 0:
+        if os.path.exists(audio_path): os.remove(audio_path)
+        raise RuntimeError(errors.strip() or "ffmpeg failed")
+    return audio_name
+
+def task_video_to_audio(vid_path, progress=NullProgress()):
+    try:
+        if VIDEO_AUDIO_FAST_PATH:
+            try:
+                audio_name = extract_audio_ffmpeg(vid_path, progress)
+                return {"file_url": f"/static/{audio_name}", "artifact": audio_name}
+            except Exception as e:
+                print(f"Fast audio extraction failed, falling back to MoviePy: {e}")
+        audio_name = f"extracted_{uuid.uuid4().hex[:8]}.mp3"
+        audio_path = os.path.join(STATIC_FOLDER, audio_name)
+        # A progress logger (never a file logger) so MoviePy does not write logs to read-only directories
+        progress.update(2, "Opening video")
+        with VideoFileClip(vid_path) as clip:
+            clip.audio.write_audiofile(audio_path, logger=MoviepyProgress(progress, "Extracting audio", 5, 100))
+        return {"file_url": f"/static/{audio_name}", "artifact": audio_name}
+    finally:
+        if os.path.exists(vid_path):
+            try: os.remove(vid_path)
+            except: pass
+
+JOB_TASKS = {
+    "generate_quiz": task_generate_quiz,
+    "make_ppt": task_make_ppt,
+    "audio_to_text": task_audio_to_text,
+    "video_to_audio": task_video_to_audio,
+}
+
+@app.route('/generate-quiz', methods=['POST'])
+def generate_quiz():
+    log_activity('quiz_gen', 'Generated a Quiz')
+    
+    topic = request.form.get('topic', 'General Knowledge')
+    count = request.form.get('count', '5')
+    return run_media_task("generate_quiz", {"topic": topic, "count": count})
+
+@app.route('/make-ppt', methods=['POST'])
+def make_ppt():
+    # 1. Get Data from Request
+    topic = request.form.get('topic', 'Presentation')
+    source_text = request.form.get('source_text', '') # <--- NOW USING YOUR INPUT TEXT
+
+    log_activity('text_gen', f'Generated PPT: {topic}')
+    
+    payload = {"topic": topic, "source_text": source_text}
+    template_name = request.form.get('template_name')
+    template = request.files.get('template_file')
+    if template_name:
+        # Library template: no upload, no parse, just a copy of the pinned in-memory template
+        entry = PresentationTemplate.query.filter_by(name=template_name).first()
+        if not entry: return jsonify({"success": False, "error": f"Unknown template '{template_name}'"}), 404
+        payload.update(template_key=entry.sha256, layout_index=entry.content_layout, pin_template=True)
+    elif template:
+        payload["template_key"] = pptx_templates.add_upload(template)
+    return run_media_task("make_ppt", payload)
+
+# --- PRESENTATION TEMPLATE LIBRARY ---
+TEMPLATE_NAME = re.compile(r'^[\w .-]{1,80}$')
+
+def template_payload(entry, with_layouts=False):
+    data = {
+        "name": entry.name, "size": entry.size, "content_layout": entry.content_layout,
+        "created_at": entry.created_at.strftime("%Y-%m-%d %H:%M") if entry.created_at else None
+    }
+    if with_layouts: data["layouts"] = json.loads(entry.layouts)
+    return data
+
+@app.route('/api/templates')
+def list_templates():
+    if not session.get('user_name') and not session.get('is_admin'):
+        return jsonify({"error": "Unauthorized"}), 403
+    entries = PresentationTemplate.query.order_by(PresentationTemplate.name).all()
+    return jsonify([template_payload(e, with_layouts=session.get('is_admin', False)) for e in entries])
+
+@app.route('/api/templates', methods=['POST'])
+def register_template():
+    if not session.get('is_admin'): return jsonify({"success": False, "error": "Unauthorized"}), 403
+    name = request.form.get('name', '').strip()
+    template = request.files.get('template_file')
+    if not template:
+        return jsonify({"success": False, "error": "Template name and .pptx file required"}), 400
+    # Names end up in URLs (DELETE /api/templates/<name>) and in every user's template picker
+    if not TEMPLATE_NAME.match(name):
+        return jsonify({"success": False, "error": "Template names may only use letters, digits, spaces, '.', '-' and '_' (max 80)"}), 400
+
+    key = pptx_templates.add_upload(template)
+    try:
+        # Parse and index once here; pinned so /make-ppt never re-parses it in this process
+        layouts, content_layout = index_layouts(pptx_templates.parsed_template(key, pin=True))
+        if not layouts: raise ValueError("no slide layouts")
+    except Exception as e:
+        print(f"Template Validation Error: {e}")
+        if key not in library_template_keys(): pptx_templates.discard(key)
+        return jsonify({"success": False, "error": "Not a usable PowerPoint template"}), 400
+
+    entry = PresentationTemplate.query.filter_by(name=name).first() or PresentationTemplate(name=name)
+    old_key = entry.sha256
+    entry.sha256 = key
+    entry.size = os.path.getsize(pptx_templates.path_for(key))
+    entry.layouts = json.dumps(layouts)
+    entry.content_layout = content_layout
+    entry.created_at = datetime.datetime.now()
+    db.session.add(entry)
+    db.session.commit()
+    if old_key and old_key != key and old_key not in library_template_keys(): pptx_templates.unpin(old_key)
+    return jsonify({"success": True, **template_payload(entry, with_layouts=True)})
+
+@app.route('/api/templates/<name>', methods=['DELETE'])
+def delete_template(name):
+    if not session.get('is_admin'): return jsonify({"success": False, "error": "Unauthorized"}), 403
+    entry = PresentationTemplate.query.filter_by(name=name).first()
+    if not entry: return jsonify({"success": False, "error": "Template not found"}), 404
+    db.session.delete(entry)
+    db.session.commit()
+    # The file stays in the store (LRU-evicted like any upload) unless another name still uses it
+    if entry.sha256 not in library_template_keys(): pptx_templates.unpin(entry.sha256)
+    return jsonify({"success": True})
+
+# --- TTS AUDIO CACHE ---
+class TTSCache:
+    """Content-addressed MP3 cache on disk, evicted least-recently-used (by mtime) past max_bytes."""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def make_key(text, lang, tld, slow):
+        normalized = " ".join(text.split())
+        raw = json.dumps([normalized, lang.lower(), tld, bool(slow)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, key, count=True):
+        """count=False for follow-up checks of a key whose hit/miss was already recorded."""
+        path = os.path.join(self.folder, f"{key}.mp3")
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            if count:
+                with self.lock: self.misses += 1
+            return None
+        if count:
+            with self.lock: self.hits += 1
+        return path
+
+    def store(self, key, write):
+        """write(tmp_path) produces the MP3; it is renamed into place so readers never see a partial file."""
+        path = os.path.join(self.folder, f"{key}.mp3")
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def store_streaming(self, key, chunks):
+        """Yields chunks to the client while teeing them into the cache; only a complete stream is kept."""
+        path = os.path.join(self.folder, f"{key}.mp3")
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+            # Only now is the parked request no longer needed: later GETs are served from the cache
+            self.discard_request(key)
+            self.evict()
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    # Streamed synthesis is a POST (which carries the text) followed by a GET the <audio> tag can play,
+    # so the request parameters are parked next to the cache entry, where every worker can read them.
+    def save_request(self, key, params):
+        with open(os.path.join(self.folder, f"{key}.json"), "w") as fh:
+            json.dump(params, fh)
+
+    def load_request(self, key):
+        # Not consumed on read: a Download click, a reload or a Range probe may GET the URL again mid-stream
+        try:
+            with open(os.path.join(self.folder, f"{key}.json")) as fh: return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def discard_request(self, key):
+        try: os.remove(os.path.join(self.folder, f"{key}.json"))
+        except OSError: pass
+
+    def evict(self):
+        entries = []
+        stale_before = time.time() - CLEANUP_FILE_TTL
+        for entry in os.scandir(self.folder):
+            if not entry.is_file(): continue
+            st = entry.stat()
+            if entry.name.endswith('.mp3'):
+                entries.append((st.st_mtime, st.st_size, entry.path))
+            elif entry.name.endswith('.json') and st.st_mtime < stale_before:
+                # A parked stream request nobody came back for
+                try: os.remove(entry.path)
+                except OSError: pass
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError: pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else 0}
+
+tts_cache = TTSCache(os.path.join(STATIC_FOLDER, "tts_cache"), TTS_CACHE_MAX_BYTES)
+
+# --- PARALLEL SPEECH SYNTHESIS ---
+def synthesize_gtts(text, lang, tld, slow):
+    buf = BytesIO()
+    gTTS(text=text, lang=lang, tld=tld, slow=slow).write_to_fp(buf)
+    return buf.getvalue()
+
+# Pluggable synthesizers: name -> fn(text, lang, tld, slow) -> MP3 bytes. Pick one with TTS_BACKEND.
+TTS_BACKENDS = {
+    "gtts": synthesize_gtts,
+}
+
+SENTENCE_END = re.compile(r'(?<=[.!?;:\u3002\uff01\uff1f])\s+|\n+')
+
+def split_tts_segments(text, max_chars=TTS_SEGMENT_CHARS):
+    """Packs whole sentences into segments of up to max_chars; an overlong sentence is split on spaces."""
+    segments, current = [], ""
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        # Segments are spoken in list order: always flush what is pending before emitting new pieces,
+        # so the pieces of an overlong sentence never play ahead of the sentences before it
+        if current and len(sentence) > max_chars:
+            segments.append(current)
+            current = ""
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            segments.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if not sentence: continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current: segments.append(current)
+    return segments
+
+def iter_speech(text, lang, tld='com', slow=False):
+    """Synthesizes segments on a bounded pool and yields their MP3 bytes in document order."""
+    synthesize = TTS_BACKENDS[TTS_BACKEND]
+    segments = split_tts_segments(text)
+    # Give the first sentence its own segment so a streaming client can start playing sooner
+    head = SENTENCE_END.split(segments[0], 1) if segments else []
+    if len(head) == 2 and head[1].strip():
+        segments[:1] = [head[0].strip(), head[1].strip()]
+    if len(segments) <= 1:
+        yield synthesize(text, lang, tld, slow)
+        return
+    with ThreadPoolExecutor(max_workers=min(TTS_WORKERS, len(segments))) as pool:
+        futures = [pool.submit(synthesize, segment, lang, tld, slow) for segment in segments]
+        for future in futures:
+            yield future.result()
+
+def write_speech(text, lang, tld, slow, path):
+    # MP3 is a stream of self-contained frames, so segment files can simply be concatenated
+    with open(path, "wb") as out:
+        for chunk in iter_speech(text, lang, tld, slow):
+            out.write(chunk)
 
 @app.route('/text-to-audio', methods=['POST'])
 def text_to_audio():
@@ -604,28 +2396,66 @@ def text_to_audio():
     try:
         text = request.form.get('text')
         lang = request.form.get('target_language', 'en').split('-')[0]
-        tts = gTTS(text=text, lang=lang)
-        fname = f"audio_{uuid.uuid4().hex[:8]}.mp3"
-        tts.save(os.path.join(STATIC_FOLDER, fname))
-        return jsonify({"success": True, "file_url": f"/static/{fname}"})
+        tld = request.form.get('tld', 'com')  # accent, e.g. 'co.uk'
+        if tld not in TTS_ACCENT_TLDS:
+            return jsonify({"success": False, "error": "Unsupported accent"}), 400
+        slow = request.form.get('slow') == '1'
+        key = TTSCache.make_key(text, lang, tld, slow)
+        if not tts_cache.lookup(key):
+            # stream=1: hand back a URL that plays while the segments are still being synthesized
+            if request.form.get('stream') == '1':
+                tts_cache.save_request(key, {"text": text, "lang": lang, "tld": tld, "slow": slow})
+                return jsonify({"success": True, "file_url": f"/text-to-audio/stream/{key}", "streaming": True})
+            tts_cache.store(key, lambda path: write_speech(text, lang, tld, slow, path))
+        return jsonify({"success": True, "file_url": f"/static/tts_cache/{key}.mp3"})
     except Exception as e: return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/text-to-audio/stream/<key>')
+def text_to_audio_stream(key):
+    # The POST that handed out this URL already counted the lookup
+    if tts_cache.lookup(key, count=False):
+        return redirect(f"/static/tts_cache/{key}.mp3")
+    params = tts_cache.load_request(key)
+    if not params:
+        return jsonify({"success": False, "error": "Unknown or expired audio request"}), 404
+
+    chunks = iter_speech(params["text"], params["lang"], params["tld"], params["slow"])
+    return Response(
+        tts_cache.store_streaming(key, chunks),
+        mimetype="audio/mpeg",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/audio-to-text', methods=['POST'])
 def audio_to_text():
     log_activity('transcribe', 'Transcribed Audio File')
     f = request.files['file']
     fname = f"temp_{uuid.uuid4().hex}.wav"
     path = os.path.join(STATIC_FOLDER, fname)
-    f.save(path)
-    try:
-        r = sr.Recognizer()
-        with sr.AudioFile(path) as src:
-            txt = r.recognize_google(r.record(src), language=request.form.get('language', 'en-US'))
-        os.remove(path)
-        return jsonify({"success": True, "text": txt})
-    except Exception as e: 
-        if os.path.exists(path): os.remove(path)
-        return jsonify({"success": False, "error": str(e)}), 500
+    claim_upload(f, path)
+    return run_media_task("audio_to_text", {"path": path, "language": request.form.get('language', 'en-US')})
+
+@app.route('/audio-to-text/stream', methods=['POST'])
+def audio_to_text_stream():
+    # Same transcription, but each segment is pushed as an SSE 'segment' event as soon as it is ready
+    log_activity('transcribe', 'Transcribed Audio File')
+    f = request.files['file']
+    path = os.path.join(STATIC_FOLDER, f"temp_{uuid.uuid4().hex}.wav")
+    claim_upload(f, path)
+    language = request.form.get('language', 'en-US')
+
+    def generate():
+        texts = []
+        try:
+            for segment in iter_transcript(path, language):
+                if segment["text"]: texts.append(segment["text"])
+                yield sse_event(segment, "segment")
+        except Exception as e:
+            yield sse_event({"error": str(e)}, "error")
+            return
+        yield sse_event({"text": " ".join(texts)}, "done")
+
+    return sse_response(generate())
 
 @app.route('/convert-file', methods=['POST'])
 def convert_file():
@@ -637,6 +2467,7 @@ def convert_file():
         if fmt in ['JPG','JPEG']: img = img.convert('RGB')
         fname = f"conv_{uuid.uuid4().hex[:8]}.{fmt.lower()}"
         img.save(os.path.join(STATIC_FOLDER, fname), fmt)
+        register_artifact(fname)
         return jsonify({"success": True, "file_url": f"/static/{fname}"})
     except Exception as e: return jsonify({"success": False, "error": str(e)}), 500
 
@@ -648,6 +2479,7 @@ def compress_image():
         img = PIL.Image.open(f).convert('RGB')
         fname = f"comp_{uuid.uuid4().hex[:8]}.jpg"
         img.save(os.path.join(STATIC_FOLDER, fname), "JPEG", quality=30, optimize=True)
+        register_artifact(fname)
         return jsonify({"success": True, "file_url": f"/static/{fname}"})
     except Exception as e: return jsonify({"success": False, "error": str(e)}), 500
 
@@ -656,8 +2488,12 @@ def text_to_pdf():
     log_activity('pdf_gen', 'Generated PDF Document')
     fname = f"doc_{uuid.uuid4().hex[:8]}.pdf"
     try:
+        pdf_bytes = pdf_renderer.render(request.form.get('html_content', ''))
+        # inline=1: the PDF is the response body, nothing is written to STATIC_FOLDER
+        if request.form.get('inline') == '1': return pdf_response(pdf_bytes, fname)
         with open(os.path.join(STATIC_FOLDER, fname), "w+b") as f:
-            pisa.CreatePDF(BytesIO(request.form.get('html_content', '').encode('utf-8')), dest=f)
+            f.write(pdf_bytes)
+        register_artifact(fname)
         return jsonify({"success": True, "file_url": f"/static/{fname}"})
     except Exception as e: return jsonify({"success": False, "error": str(e)}), 500
 
@@ -670,22 +2506,8 @@ def video_to_audio():
     file = request.files['file']
     vid_name = f"temp_vid_{uuid.uuid4().hex[:8]}.mp4"
     vid_path = os.path.join(STATIC_FOLDER, vid_name)
-    file.save(vid_path)
-    
-    audio_name = f"extracted_{uuid.uuid4().hex[:8]}.mp3"
-    audio_path = os.path.join(STATIC_FOLDER, audio_name)
-    
-    try:
-        # Added logger=None to prevent MoviePy from trying to write log files to read-only directories
-        with VideoFileClip(vid_path) as clip:
-            clip.audio.write_audiofile(audio_path, logger=None)
-        return jsonify({"success": True, "file_url": f"/static/{audio_name}"})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-    finally:
-        if os.path.exists(vid_path):
-            try: os.remove(vid_path)
-            except: pass
+    claim_upload(file, vid_path)
+    return run_media_task("video_to_audio", {"vid_path": vid_path})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
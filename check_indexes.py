@@ -0,0 +1,52 @@
+# Prints the SQLite query plan for each admin query and flags any that scan activity_log without an index.
+# Run it against your users.db after upgrading (starting the app adds missing indexes).
+import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects import sqlite
+
+from app import app, db, User, ActivityLog, filtered_activity_logs, after_log_cursor, encode_log_cursor
+
+def admin_queries():
+    activity = db.session.query(
+        ActivityLog.user_id.label('user_id'),
+        func.max(ActivityLog.timestamp).label('last_seen'),
+        func.count(ActivityLog.id).label('action_count')
+    ).filter(ActivityLog.user_id.isnot(None)).group_by(ActivityLog.user_id).subquery()
+
+    # The same query builders the routes use, so the plans below are the plans they get
+    page_two = encode_log_cursor(ActivityLog(id=1, timestamp=datetime.datetime.now()))
+    return {
+        "/api/users (aggregate)": db.session.query(User.id, activity.c.last_seen, activity.c.action_count)
+            .outerjoin(activity, activity.c.user_id == User.id),
+        "/api/activity-logs (recent)": filtered_activity_logs({}).limit(101),
+        "/api/activity-logs (next page)": after_log_cursor(filtered_activity_logs({}), page_two).limit(101),
+        "/api/activity-logs (by user)": filtered_activity_logs({"user": "admin"}).limit(101),
+        "/api/activity-logs (by type)": filtered_activity_logs({"action": "chat_msgs"}).limit(101),
+        "/api/activity-logs (date range)": filtered_activity_logs({"start": "2024-01-01", "end": "2024-01-31"}).limit(101),
+        "/download-report": filtered_activity_logs({}),
+    }
+
+def explain(query):
+    sql = str(query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return [row[-1] for row in rows]
+
+print("------------------------------------------------")
+print("🔍 ACTIVITY LOG QUERY PLANS")
+print("------------------------------------------------")
+
+failures = 0
+with app.app_context():
+    for name, query in admin_queries().items():
+        plan = explain(query)
+        # A bare 'SCAN activity_log' (no index) means a full table scan
+        full_scan = any(step.startswith("SCAN activity_log") and "INDEX" not in step for step in plan)
+        failures += full_scan
+        print(f"{'❌' if full_scan else '✅'} {name}")
+        for step in plan:
+            print(f"     {step}")
+
+print("------------------------------------------------")
+print("❌ Some queries scan activity_log without an index." if failures else "✅ All admin queries use an index.")
+raise SystemExit(1 if failures else 0)